@@ -1,21 +1,59 @@
 import streamlit as st
-import tempfile
+import gc
+import hashlib
+import inspect
 import os
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
 from pathlib import Path
-from pdf2image import convert_from_path
+import diskcache
+import fitz  # PyMuPDF
 from PIL import Image
 import io
+from pdf_render import render_page, render_pages, resize_image
 
 # Import MLX VLM
 try:
-    from mlx_vlm import load as mlx_load, generate
+    from mlx_vlm import load as mlx_load, generate, stream_generate
     from mlx_vlm.prompt_utils import apply_chat_template
     from mlx_vlm.utils import load_config
+    import mlx.core as mx
     MLX_AVAILABLE = True
 except ImportError:
     MLX_AVAILABLE = False
     st.error("MLX VLM not available. Please install mlx-vlm.")
 
+# KV prompt cache reuse across requests (mlx-vlm >= 0.4.0)
+try:
+    from mlx_vlm import PromptCacheState
+    PROMPT_CACHE_AVAILABLE = True
+except ImportError:
+    PROMPT_CACHE_AVAILABLE = False
+
+# Batched generation across pages. Needs batch_generate (mlx-vlm >= 0.3.12)
+# and logits processor support in batches (mlx-vlm >= 0.5.0), so batched
+# pages get the same repetition penalty as single-page OCR
+try:
+    from mlx_vlm import batch_generate
+    from mlx_vlm.generate import BatchGenerator
+    try:
+        from mlx_vlm.sample_utils import make_logits_processors, make_sampler
+    except ImportError:
+        from mlx_lm.sample_utils import make_logits_processors, make_sampler
+    batch_generator_params = inspect.signature(BatchGenerator.__init__).parameters
+    BATCH_AVAILABLE = "logits_processors" in batch_generator_params
+    BATCH_DRAFT_AVAILABLE = "draft_model" in batch_generator_params
+except ImportError:
+    BATCH_AVAILABLE = False
+    BATCH_DRAFT_AVAILABLE = False
+
+# Speculative decoding drafters (newer mlx-vlm releases only)
+try:
+    from mlx_vlm.speculative.drafters import load_drafter
+    SPECULATIVE_AVAILABLE = True
+except ImportError:
+    SPECULATIVE_AVAILABLE = False
+
 # Page configuration
 st.set_page_config(
     page_title="PDF OCR with Local Vision LLM",
@@ -23,34 +61,25 @@ st.set_page_config(
     layout="wide"
 )
 
-# Helper function to resize image
-def resize_image(image: Image.Image, max_size: int) -> Image.Image:
-    """
-    Resize image to fit within max_size while maintaining aspect ratio.
-    
-    Args:
-        image: PIL Image to resize
-        max_size: Maximum dimension (width or height) in pixels
-    
-    Returns:
-        Resized PIL Image
-    """
-    width, height = image.size
-    
-    # If image is already smaller than max_size, return as-is
-    if width <= max_size and height <= max_size:
-        return image
-    
-    # Calculate new dimensions maintaining aspect ratio
-    if width > height:
-        new_width = max_size
-        new_height = int(height * (max_size / width))
-    else:
-        new_height = max_size
-        new_width = int(width * (max_size / height))
-    
-    # Resize using high-quality Lanczos resampling
-    return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+# Probe for MXFP4 quantization support (newer MLX releases only)
+@st.cache_resource
+def mxfp4_available():
+    """Check once per process whether MLX can quantize in MXFP4 mode"""
+    if not MLX_AVAILABLE:
+        return False
+    try:
+        mx.quantize(mx.zeros((32, 32)), group_size=32, bits=4, mode="mxfp4")
+        return True
+    except (TypeError, ValueError, RuntimeError):
+        return False
+
+# On-disk OCR result cache, kept across app restarts
+OCR_CACHE_DIR = Path.home() / ".cache" / "local_pdf_ocr"
+
+@st.cache_resource
+def get_ocr_cache():
+    """Open the disk-backed OCR result cache shared by all sessions"""
+    return diskcache.Cache(str(OCR_CACHE_DIR))
 
 # Title and description
 st.title("📄 PDF OCR with Local Vision LLM")
@@ -60,14 +89,18 @@ st.markdown("Upload a PDF and extract text using a local Qwen3-VL model via MLX"
 with st.sidebar:
     st.header("⚙️ Model Configuration")
     
-    # Model selection dropdown
+    # Model selection dropdown (4-bit only: OCR is memory-bandwidth bound and
+    # 8-bit weights offer no accuracy win for it)
     available_models = [
         "mlx-community/Qwen3-VL-2B-Instruct-4bit",
-        "mlx-community/Qwen3-VL-2B-Instruct-8bit",
         "mlx-community/Qwen3-VL-8B-Instruct-4bit",
-        "mlx-community/Qwen3-VL-8B-Instruct-8bit",
         "mlx-community/Qwen3-VL-32B-Instruct-4bit",
     ]
+    if mxfp4_available():
+        available_models += [
+            "mlx-community/Qwen3-VL-2B-Instruct-mxfp4",
+            "mlx-community/Qwen3-VL-8B-Instruct-mxfp4",
+        ]
     
     # Extract provider name from first model
     model_provider = available_models[0].split('/')[0]
@@ -81,26 +114,30 @@ with st.sidebar:
     )
     
     # Show model info
-    if "2B" in model_name and "4bit" in model_name:
+    if "2B" in model_name:
         st.caption("📦 ~0.7GB download")
-    elif "2B" in model_name and "8bit" in model_name:
-        st.caption("📦 ~1.5GB download")
-    elif "8B" in model_name and "4bit" in model_name:
+    elif "8B" in model_name:
         st.caption("📦 ~2.5GB download")
-    elif "8B" in model_name and "8bit" in model_name:
-        st.caption("📦 ~5GB download")
-    elif "32B" in model_name and "4bit" in model_name:
+    elif "32B" in model_name:
         st.caption("📦 ~10GB download")
     
+    # Speculative decoding only pays off for large target models
+    draft_model_name = None
+    if SPECULATIVE_AVAILABLE and "32B" in model_name:
+        draft_model_name = st.text_input(
+            "Draft model (optional)",
+            help="HuggingFace repo or local path of a speculative-decoding drafter for this model. It proposes tokens that the 32B model verifies in parallel."
+        ).strip() or None
+    
     # Image processing settings
     st.subheader("Image Processing")
     max_image_size = st.slider(
         "Max Image Dimension (px)",
         min_value=512,
         max_value=2048,
-        value=1536,
-        step=128,
-        help="Resize images to this maximum dimension (width or height) before processing. Lower values use less memory."
+        value=1600,
+        step=64,
+        help="Resize rendered pages to this maximum dimension (width or height) before OCR. Vision encoding cost grows with pixel count, so lower values are faster and use less memory."
     )
     
     # OCR prompt
@@ -110,36 +147,259 @@ with st.sidebar:
         help="Customize the prompt for OCR extraction"
     )
     
+    # Cached results are reused for identical pages, model and prompt
+    if st.button("🗑️ Clear cache", help=f"Delete saved OCR results in {OCR_CACHE_DIR}"):
+        get_ocr_cache().clear()
+        st.success("✅ OCR cache cleared")
+    
     st.divider()
     st.markdown("### About")
     st.markdown("""
     This app uses:
     - **Qwen3-VL** vision models
     - **MLX** for Apple Silicon optimization
-    - **pdf2image** for PDF conversion
+    - **PyMuPDF** for PDF rendering
     
     **Note:** PyTorch is required for the model processor but inference runs on MLX.
     """)
 
-# Initialize session state
-if 'model' not in st.session_state:
-    st.session_state.model = None
-    st.session_state.processor = None
-    st.session_state.model_loaded = False
-    st.session_state.model_name = None
+# Release MLX's cached GPU buffers back to the system
+def clear_mlx_cache():
+    """Clear the MLX buffer cache (API moved from mx.metal in newer MLX)"""
+    if hasattr(mx, "clear_cache"):
+        mx.clear_cache()
+    else:
+        mx.metal.clear_cache()
 
 # Model loading function
+@st.cache_resource(max_entries=1, show_spinner=False)
 def load_vision_model(model_name):
-    """Load the MLX vision model"""
-    try:
-        model, processor = mlx_load(model_name)
-        config = load_config(model_name)
-        return model, processor, config, None
-    except Exception as e:
-        return None, None, None, str(e)
+    """Load the MLX vision model, keeping only the most recent one resident"""
+    model, processor = mlx_load(model_name)
+    config = load_config(model_name)
+    
+    # Warm up with a tiny generation so Metal kernels are compiled before
+    # the first real OCR request, then drop the warm-up buffers
+    warmup_prompt = apply_chat_template(processor, config, "Describe this image.", num_images=1)
+    generate(
+        model,
+        processor,
+        warmup_prompt,
+        Image.new("RGB", (64, 64), "white"),
+        max_tokens=8,
+        verbose=False
+    )
+    clear_mlx_cache()
+    
+    return model, processor, config
+
+# Draft model loading function
+@st.cache_resource(max_entries=1, show_spinner=False)
+def load_draft_model(draft_model_name):
+    """Load a speculative-decoding drafter, returning (model, kind)"""
+    return load_drafter(draft_model_name)
+
+# Process-wide record of the model held by load_vision_model
+@st.cache_resource
+def resident_model():
+    """Track which model is currently loaded, shared across sessions"""
+    return {"name": None}
+
+# Model release function
+def release_vision_model():
+    """Drop the cached model and return its memory before another one is loaded"""
+    load_vision_model.clear()
+    if SPECULATIVE_AVAILABLE:
+        load_draft_model.clear()
+    resident_model()["name"] = None
+    if 'prefix_cache' in st.session_state:
+        st.session_state.prefix_cache.clear()
+    gc.collect()
+    clear_mlx_cache()
+
+# Prompt formatting function
+@st.cache_data(show_spinner=False)
+def format_prompt(model_name, prompt, num_images):
+    """Apply the model's chat template, cached per (model_name, prompt, num_images)"""
+    _, processor, config = load_vision_model(model_name)
+    return apply_chat_template(processor, config, prompt, num_images=num_images)
+
+# Page content hashing function
+def image_hash(image: Image.Image) -> str:
+    """Hash rendered pixel data (blake2b is fast on ARM)"""
+    return hashlib.blake2b(image.tobytes(), digest_size=16).hexdigest()
+
+# Bump to invalidate OCR results cached by older versions of the app
+# (version 2: batched pages were previously OCR'd with a double-templated prompt)
+OCR_CACHE_VERSION = "2"
+
+# OCR result cache key function
+def ocr_cache_key(model_name, prompt, image):
+    """Key identifying an OCR result: identical pages share it across documents and restarts"""
+    key_source = "\0".join((OCR_CACHE_VERSION, model_name, prompt, image_hash(image)))
+    return hashlib.blake2b(key_source.encode(), digest_size=16).hexdigest()
+
+# Number of per-page KV caches kept in memory
+PREFIX_CACHE_SIZE = 4
+
+# Prompt cache lookup function
+def get_prompt_cache_state(model_name, image):
+    """
+    Get the KV prompt cache for a model/page pair, evicting least recently used entries.
+    
+    The cache is keyed on the page content rather than the prompt: mlx-vlm reuses
+    the longest matching token prefix, so re-running a page with a tweaked prompt
+    skips the vision encode and prefill of the shared image prefix.
+    
+    Args:
+        model_name: Name of the loaded model
+        image: PIL Image being processed
+    
+    Returns:
+        PromptCacheState to pass to stream_generate
+    """
+    if 'prefix_cache' not in st.session_state:
+        st.session_state.prefix_cache = OrderedDict()
+    prefix_cache = st.session_state.prefix_cache
+    
+    key = (model_name, image_hash(image))
+    if key in prefix_cache:
+        prefix_cache.move_to_end(key)
+    else:
+        prefix_cache[key] = PromptCacheState()
+        while len(prefix_cache) > PREFIX_CACHE_SIZE:
+            prefix_cache.popitem(last=False)
+    
+    return prefix_cache[key]
+
+# Prompt cache removal function
+def discard_prompt_cache_state(model_name, image):
+    """Drop the KV prompt cache for a model/page pair, e.g. after an interrupted run"""
+    if 'prefix_cache' in st.session_state:
+        st.session_state.prefix_cache.pop((model_name, image_hash(image)), None)
+
+# Decoding settings shared by single-page and whole-document OCR, so both
+# modes produce comparable text for the same cache key
+OCR_TEMPERATURE = 0.1
+
+# Generation limits for OCR output
+MAX_OCR_TOKENS = 2048
+MIN_OCR_TOKENS = 256
+POINTS_SQ_PER_TOKEN = 236
+REPETITION_PENALTY = 1.05
+REPETITION_CONTEXT_SIZE = 20
+
+# Stop decoding once the model starts emitting runs of blank lines
+EARLY_STOP_SEQUENCE = "\n\n\n\n"
+
+# Output cleanup function
+def trim_runaway_output(text: str) -> str:
+    """Cut text at the first EARLY_STOP_SEQUENCE and drop trailing whitespace"""
+    return text.split(EARLY_STOP_SEQUENCE, 1)[0].rstrip()
+
+# Tokenization slack when checking batched output against its budget
+TOKEN_LIMIT_MARGIN = 8
+
+# Truncation check for batched output
+def reached_token_limit(processor, text: str, max_tokens: int) -> bool:
+    """
+    Check whether batched output used up its token budget and was likely cut off.
+    
+    batch_generate reports no per-page token counts, so the text is re-encoded;
+    TOKEN_LIMIT_MARGIN covers small differences after detokenization.
+    
+    Args:
+        processor: Model processor (or tokenizer)
+        text: Generated text, before runaway trimming
+        max_tokens: Budget the page was generated with
+    
+    Returns:
+        True if the output should be treated as truncated
+    """
+    if EARLY_STOP_SEQUENCE in text:
+        return False
+    tokenizer = processor.tokenizer if hasattr(processor, "tokenizer") else processor
+    return len(tokenizer.encode(text, add_special_tokens=False)) >= max_tokens - TOKEN_LIMIT_MARGIN
+
+# Token budget function
+def estimate_max_tokens(page_rect: fitz.Rect) -> int:
+    """
+    Estimate an output token budget from the physical page size.
+    
+    The page area in PDF points is used rather than the rendered image, so
+    lowering the max image dimension never cuts off the output. A full
+    letter or A4 page gets the whole MAX_OCR_TOKENS budget.
+    
+    Args:
+        page_rect: PyMuPDF page rectangle, in points
+    
+    Returns:
+        max_tokens value clamped to [MIN_OCR_TOKENS, MAX_OCR_TOKENS]
+    """
+    area = int(page_rect.width * page_rect.height)
+    return min(MAX_OCR_TOKENS, max(MIN_OCR_TOKENS, area // POINTS_SQ_PER_TOKEN))
+
+# Process pool for rendering pages, started once and reused across reruns
+@st.cache_resource
+def get_render_pool():
+    """Create the worker pool used to rasterize whole documents"""
+    return ProcessPoolExecutor(max_workers=os.cpu_count())
+
+# Parallel rasterization function
+def render_all_pages(pdf_bytes: bytes, page_count: int, max_size: int, dpi: int = 150) -> list:
+    """
+    Render and downscale every page of a PDF across CPU cores.
+    
+    Args:
+        pdf_bytes: Raw PDF file contents
+        page_count: Number of pages in the document
+        max_size: Maximum dimension (width or height) of the returned images
+        dpi: Rendering resolution in dots per inch
+    
+    Returns:
+        List of downscaled RGB PIL Images in page order
+    """
+    # One interleaved set of pages per worker, so each opens the PDF only once
+    workers = min(os.cpu_count() or 1, page_count)
+    chunks = [list(range(page_count))[i::workers] for i in range(workers)]
+    results = get_render_pool().map(
+        render_pages,
+        [pdf_bytes] * workers,
+        chunks,
+        [max_size] * workers,
+        [dpi] * workers
+    )
+    
+    images = [None] * page_count
+    for chunk, chunk_images in zip(chunks, results):
+        for page_index, image in zip(chunk, chunk_images):
+            images[page_index] = image
+    return images
+
+# Maximum number of pages sent to the model in one batch
+OCR_BATCH_SIZE = 8
+
+# Page batching function
+def batch_pages_by_size(images, batch_size=OCR_BATCH_SIZE):
+    """
+    Group pages of similar dimensions so each batch needs little padding.
+    
+    Args:
+        images: List of PIL Images, one per page
+        batch_size: Maximum number of pages per batch
+    
+    Returns:
+        List of batches, each a list of page indices
+    """
+    order = sorted(
+        range(len(images)),
+        key=lambda i: (round(images[i].height / 100), round(images[i].width / 100))
+    )
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
 
 # Main content area
 # Create expandable left panel
+ocr_all_pages = False
 with st.expander("📤 Upload PDF", expanded=True):
     upload_container = st.container()
     
@@ -152,139 +412,307 @@ with st.expander("📤 Upload PDF", expanded=True):
         )
         
         if uploaded_file is not None:
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                tmp_pdf_path = tmp_file.name
-            
             try:
-                # Convert PDF to images
-                with st.spinner("Converting PDF to images..."):
-                    images = convert_from_path(tmp_pdf_path, dpi=200)
+                # Open PDF in memory once per upload; pages are rasterized on demand
+                if st.session_state.get('pdf_file_id') != uploaded_file.file_id:
+                    st.session_state.pdf_bytes = uploaded_file.getvalue()
+                    st.session_state.pdf_doc = fitz.open(stream=st.session_state.pdf_bytes, filetype="pdf")
+                    st.session_state.pdf_file_id = uploaded_file.file_id
+                page_count = st.session_state.pdf_doc.page_count
                 
-                st.success(f"✅ PDF loaded successfully! Found {len(images)} page(s)")
+                st.success(f"✅ PDF loaded successfully! Found {page_count} page(s)")
                 
                 # Page selection
-                if len(images) > 1:
+                if page_count > 1:
                     page_num = st.selectbox(
                         "Select page to OCR",
-                        range(1, len(images) + 1),
+                        range(1, page_count + 1),
                         format_func=lambda x: f"Page {x}"
                     )
                 else:
                     page_num = 1
                 
-                # Display selected page
-                selected_image = images[page_num - 1]
+                # Whole-document mode
+                if page_count > 1:
+                    ocr_all_pages = st.checkbox(
+                        "OCR entire document",
+                        help="Extract text from every page, batching similarly sized pages together"
+                    )
+                
+                # Render selected page and downscale it for the vision model
+                with st.spinner("Rendering page..."):
+                    rendered_image = render_page(st.session_state.pdf_doc, page_num - 1, dpi=150)
+                    selected_image = resize_image(rendered_image, max_image_size)
+                
+                # Show resize info if image was resized
+                if rendered_image.size != selected_image.size:
+                    st.caption(f"ℹ️ Image resized from {rendered_image.size[0]}x{rendered_image.size[1]} to {selected_image.size[0]}x{selected_image.size[1]} for processing")
+                
                 st.image(selected_image, caption=f"Page {page_num}", width="stretch")
                 
                 # Store in session state
                 st.session_state.current_image = selected_image
                 st.session_state.page_num = page_num
+                st.session_state.page_rect = st.session_state.pdf_doc[page_num - 1].rect
                 
             except Exception as e:
                 st.error(f"Error processing PDF: {str(e)}")
-            finally:
-                # Clean up temp file
-                if os.path.exists(tmp_pdf_path):
-                    os.unlink(tmp_pdf_path)
 
 # OCR Results section
 st.header("📝 OCR Results")
 
 if 'current_image' in st.session_state:
-    # Load model button
-    if not st.session_state.model_loaded or st.session_state.model_name != model_name:
-        if st.button("🔄 Load Model", type="primary"):
-            with st.spinner(f"Loading model: {model_name}..."):
-                model, processor, config, error = load_vision_model(model_name)
-            
-            if error:
-                st.error(f"Failed to load model: {error}")
-                st.info("Make sure the model is available. You may need to download it first.")
-            else:
-                st.session_state.model = model
-                st.session_state.processor = processor
-                st.session_state.config = config
-                st.session_state.model_loaded = True
-                st.session_state.model_name = model_name
-                st.success("✅ Model loaded successfully!")
-                st.rerun()
+    # Per-run cache bypass, e.g. to retry a page whose cached result is wrong
+    ignore_cache = st.checkbox(
+        "Ignore cached results",
+        help="Run OCR again even if a cached result exists; the new result replaces it"
+    )
     
     # OCR button
-    if st.session_state.model_loaded:
-        st.success(f"✅ Model ready: {st.session_state.model_name}")
+    if st.button("🚀 Extract Text", type="primary"):
+        model = None
+        draft_kwargs = {}
+        try:
+            # Free the previous model first so two models are never resident at once
+            if resident_model()["name"] not in (None, model_name):
+                release_vision_model()
+            
+            with st.spinner(f"Loading model: {model_name}..."):
+                model, processor, config = load_vision_model(model_name)
+            resident_model()["name"] = model_name
+        except Exception as e:
+            st.error(f"Failed to load model: {str(e)}")
+            st.info("Make sure the model is available. You may need to download it first.")
         
-        if st.button("🚀 Extract Text", type="primary"):
+        # The drafter is optional: if it fails to load, OCR still runs without it
+        if model is not None and draft_model_name:
             try:
-                with st.spinner("Extracting text from image..."):
-                    # Prepare the image
-                    image = st.session_state.current_image
+                with st.spinner(f"Loading draft model: {draft_model_name}..."):
+                    draft_model, draft_kind = load_draft_model(draft_model_name)
+                draft_kwargs = {"draft_model": draft_model, "draft_kind": draft_kind}
+            except Exception as e:
+                st.warning(f"⚠️ Failed to load draft model: {str(e)}. Continuing without speculative decoding.")
+        
+        if model is not None:
+            try:
+                # Apply chat template to the prompt
+                formatted_prompt = format_prompt(model_name, ocr_prompt, num_images=1)
+                
+                # Finished OCR results, keyed on (model, prompt, page content hash)
+                ocr_cache = get_ocr_cache()
+                st.session_state.output_cache_note = None
+                st.session_state.output_truncated_note = None
+                
+                if ocr_all_pages:
+                    doc = st.session_state.pdf_doc
+                    progress = st.progress(0.0, text="Rendering pages...")
+                    pages = render_all_pages(st.session_state.pdf_bytes, doc.page_count, max_image_size)
                     
-                    # Resize image to prevent memory issues
-                    original_size = image.size
-                    resized_image = resize_image(image, max_image_size)
-                    resized_size = resized_image.size
+                    # Only OCR pages not seen before: repeated templates and blank
+                    # pages are resolved from the cache
+                    page_keys = [ocr_cache_key(model_name, ocr_prompt, page) for page in pages]
+                    pending_pages = {}
+                    for page_index, key in enumerate(page_keys):
+                        if (ignore_cache or key not in ocr_cache) and key not in pending_pages:
+                            pending_pages[key] = page_index
+                    unique_indices = list(pending_pages.values())
+                    unique_pages = [pages[i] for i in unique_indices]
+                    unique_keys = list(pending_pages)
                     
-                    # Show resize info if image was resized
-                    if original_size != resized_size:
-                        st.info(f"ℹ️ Image resized from {original_size[0]}x{original_size[1]} to {resized_size[0]}x{resized_size[1]} for processing")
+                    # Older BatchGenerator releases reject drafter arguments, so batched
+                    # runs drop the drafter there
+                    batch_draft_kwargs = draft_kwargs if BATCH_DRAFT_AVAILABLE else {}
+                    if draft_kwargs and BATCH_AVAILABLE and not BATCH_DRAFT_AVAILABLE:
+                        st.info("ℹ️ Speculative decoding is not supported for batched OCR in this mlx-vlm version; continuing without the draft model.")
                     
-                    # Create the prompt with image
-                    prompt = ocr_prompt
+                    # OCR similarly sized pages together, one batch at a time
+                    run_texts = {}
+                    truncated_pages = []
+                    pages_done = 0
+                    for batch in batch_pages_by_size(unique_pages):
+                        progress.progress(
+                            pages_done / len(unique_pages),
+                            text=f"Extracting text from pages... ({pages_done}/{len(unique_pages)})"
+                        )
+                        batch_images = [unique_pages[i] for i in batch]
+                        batch_budgets = [estimate_max_tokens(doc[unique_indices[i]].rect) for i in batch]
+                        
+                        if BATCH_AVAILABLE:
+                            response = batch_generate(
+                                model,
+                                processor,
+                                images=batch_images,
+                                # batch_generate applies the chat template itself, so it
+                                # takes the raw prompt rather than formatted_prompt
+                                prompts=[ocr_prompt] * len(batch_images),
+                                max_tokens=batch_budgets,
+                                sampler=make_sampler(temp=OCR_TEMPERATURE),
+                                logits_processors=make_logits_processors(
+                                    repetition_penalty=REPETITION_PENALTY,
+                                    repetition_context_size=REPETITION_CONTEXT_SIZE
+                                ),
+                                **batch_draft_kwargs
+                            )
+                            batch_results = [
+                                (text, reached_token_limit(processor, text, budget))
+                                for text, budget in zip(response.texts, batch_budgets)
+                            ]
+                        else:
+                            batch_results = []
+                            for batch_image, budget in zip(batch_images, batch_budgets):
+                                result = generate(
+                                    model,
+                                    processor,
+                                    formatted_prompt,
+                                    batch_image,
+                                    max_tokens=budget,
+                                    temperature=OCR_TEMPERATURE,
+                                    repetition_penalty=REPETITION_PENALTY,
+                                    repetition_context_size=REPETITION_CONTEXT_SIZE,
+                                    verbose=False,
+                                    **draft_kwargs
+                                )
+                                hit_limit = (
+                                    result.generation_tokens >= budget
+                                    and EARLY_STOP_SEQUENCE not in result.text
+                                )
+                                batch_results.append((result.text, hit_limit))
+                        
+                        # Pages cannot stop early mid-batch, so runaway blank-line tails
+                        # are cut afterwards to match the single-page output. Output that
+                        # hit the token limit is shown but never cached.
+                        for unique_index, (text, hit_limit) in zip(batch, batch_results):
+                            key = unique_keys[unique_index]
+                            run_texts[key] = trim_runaway_output(text)
+                            if hit_limit:
+                                truncated_pages.append(unique_indices[unique_index] + 1)
+                            else:
+                                ocr_cache[key] = run_texts[key]
+                        pages_done += len(batch)
                     
-                    # Apply chat template
-                    formatted_prompt = apply_chat_template(
-                        st.session_state.processor,
-                        st.session_state.config,
-                        prompt,
-                        num_images=1
-                    )
+                    progress.empty()
                     
-                    # Generate OCR output using resized image
-                    result = generate(
-                        st.session_state.model,
-                        st.session_state.processor,
-                        formatted_prompt,
-                        resized_image,
-                        max_tokens=2048,
-                        temperature=0.1,
-                        verbose=False
+                    # Assemble results in original page order
+                    page_texts = [run_texts[key] if key in run_texts else ocr_cache[key] for key in page_keys]
+                    st.session_state.output_text = "\n\n".join(
+                        f"## Page {i + 1}\n\n{text}" for i, text in enumerate(page_texts)
                     )
                     
-                    # Extract text from GenerationResult and store in session state
-                    st.session_state.output_text = result.text
+                    cached_count = sum(key not in run_texts for key in page_keys)
+                    if cached_count:
+                        st.session_state.output_cache_note = (
+                            f"ℹ️ {cached_count} of {len(page_keys)} pages loaded from cache. "
+                            "Tick 'Ignore cached results' to run OCR on them again."
+                        )
+                    if truncated_pages:
+                        page_list = ", ".join(str(n) for n in sorted(truncated_pages))
+                        st.session_state.output_truncated_note = (
+                            f"⚠️ Page(s) {page_list} reached the token limit and may be cut off; "
+                            "their output was not cached."
+                        )
+                    st.session_state.output_label = "All Pages"
+                    st.session_state.output_file_name = "ocr_all_pages.txt"
+                else:
+                    # Prepare the image (already downscaled at render time)
+                    image = st.session_state.current_image
+                    st.session_state.output_label = f"Page {st.session_state.page_num}"
+                    st.session_state.output_file_name = f"ocr_page_{st.session_state.page_num}.txt"
+                    
+                    key = ocr_cache_key(model_name, ocr_prompt, image)
+                    if not ignore_cache and key in ocr_cache:
+                        st.session_state.output_text = ocr_cache[key]
+                        st.session_state.output_cache_note = (
+                            "ℹ️ Loaded from cache. Tick 'Ignore cached results' to run OCR again."
+                        )
+                    else:
+                        # Clicking Stop triggers a rerun, which interrupts the stream below;
+                        # the partial output is kept because it is accumulated in session state
+                        st.button("⏹️ Stop")
+                        stream_placeholder = st.empty()
+                        
+                        # Reuse the KV cache from earlier runs on this page when supported
+                        generation_kwargs = dict(draft_kwargs)
+                        if PROMPT_CACHE_AVAILABLE:
+                            generation_kwargs["prompt_cache_state"] = get_prompt_cache_state(model_name, image)
+                        
+                        # Stream OCR output into the page as tokens are decoded
+                        budget = estimate_max_tokens(st.session_state.page_rect)
+                        generated_tokens = 0
+                        stopped_early = False
+                        st.session_state.output_text = ""
+                        
+                        # mlx-vlm only fills the KV prompt cache after the final token, so a
+                        # stream cut short (early stop, Stop rerun, error) leaves it unusable
+                        stream_completed = False
+                        try:
+                            for chunk in stream_generate(
+                                model,
+                                processor,
+                                formatted_prompt,
+                                image,
+                                max_tokens=budget,
+                                temperature=OCR_TEMPERATURE,
+                                repetition_penalty=REPETITION_PENALTY,
+                                repetition_context_size=REPETITION_CONTEXT_SIZE,
+                                **generation_kwargs
+                            ):
+                                st.session_state.output_text += chunk.text
+                                generated_tokens = chunk.generation_tokens
+                                if EARLY_STOP_SEQUENCE in st.session_state.output_text:
+                                    st.session_state.output_text = trim_runaway_output(st.session_state.output_text)
+                                    stopped_early = True
+                                    break
+                                stream_placeholder.markdown(st.session_state.output_text)
+                            stream_completed = not stopped_early
+                        finally:
+                            if PROMPT_CACHE_AVAILABLE and not stream_completed:
+                                discard_prompt_cache_state(model_name, image)
+                        
+                        stream_placeholder.empty()
+                        
+                        # Output that hit the token limit is likely cut off: show it, don't cache it
+                        if not stopped_early and generated_tokens >= budget:
+                            st.session_state.output_truncated_note = (
+                                f"⚠️ Output reached the {budget}-token limit and may be cut off; "
+                                "it was not cached."
+                            )
+                        else:
+                            ocr_cache[key] = st.session_state.output_text
                     
             except Exception as e:
                 st.error(f"Error during OCR: {str(e)}")
                 st.exception(e)
+    
+    # Display results if available
+    if 'output_text' in st.session_state and st.session_state.output_text:
+        st.subheader(f"Extracted Text ({st.session_state.output_label})")
         
-        # Display results if available
-        if 'output_text' in st.session_state and st.session_state.output_text:
-            st.subheader(f"Extracted Text (Page {st.session_state.page_num})")
-            
-            # Toggle for markdown rendering
-            render_markdown = st.toggle("Render as Markdown", value=False)
-            
-            if render_markdown:
-                st.markdown(st.session_state.output_text)
-            else:
-                st.text_area(
-                    "OCR Output",
-                    value=st.session_state.output_text,
-                    height=400,
-                    label_visibility="collapsed"
-                )
-            
-            # Download button
-            st.download_button(
-                label="📥 Download Text",
-                data=st.session_state.output_text,
-                file_name=f"ocr_page_{st.session_state.page_num}.txt",
-                mime="text/plain"
+        # Where the result came from and whether it may be incomplete
+        if st.session_state.get('output_cache_note'):
+            st.caption(st.session_state.output_cache_note)
+        if st.session_state.get('output_truncated_note'):
+            st.warning(st.session_state.output_truncated_note)
+        
+        # Toggle for markdown rendering
+        render_markdown = st.toggle("Render as Markdown", value=False)
+        
+        if render_markdown:
+            st.markdown(st.session_state.output_text)
+        else:
+            st.text_area(
+                "OCR Output",
+                value=st.session_state.output_text,
+                height=400,
+                label_visibility="collapsed"
             )
-    else:
-        st.info("👆 Click 'Load Model' to start")
+        
+        # Download button
+        st.download_button(
+            label="📥 Download Text",
+            data=st.session_state.output_text,
+            file_name=st.session_state.output_file_name,
+            mime="text/plain"
+        )
 else:
     st.info("👈 Upload a PDF file to begin")
 
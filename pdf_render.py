@@ -0,0 +1,78 @@
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Helper function to rasterize a PDF page
+def render_page(doc: fitz.Document, page_index: int, dpi: int = 150) -> Image.Image:
+    """
+    Render a single PDF page to an image.
+    
+    Args:
+        doc: Open PyMuPDF document
+        page_index: Zero-based index of the page to render
+        dpi: Rendering resolution in dots per inch
+    
+    Returns:
+        RGB PIL Image of the page
+    """
+    zoom = dpi / 72
+    pix = doc.load_page(page_index).get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    
+    # Wrap the pixmap samples without copying them again (frombytes would)
+    return Image.frombuffer("RGB", (pix.width, pix.height), pix.samples, "raw", "RGB", pix.stride, 1)
+
+# Helper function to resize image
+def resize_image(image: Image.Image, max_size: int) -> Image.Image:
+    """
+    Resize image to fit within max_size while maintaining aspect ratio.
+    
+    Args:
+        image: PIL Image to resize
+        max_size: Maximum dimension (width or height) in pixels
+    
+    Returns:
+        Resized RGB PIL Image
+    """
+    # Drop alpha/palette modes so the preprocessor never allocates an extra channel
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    width, height = image.size
+    
+    # If image is already smaller than max_size, return as-is
+    if width <= max_size and height <= max_size:
+        return image
+    
+    # Calculate new dimensions maintaining aspect ratio
+    if width > height:
+        new_width = max_size
+        new_height = int(height * (max_size / width))
+    else:
+        new_height = max_size
+        new_width = int(width * (max_size / height))
+    
+    # Resize using bilinear resampling: the vision encoder resamples again
+    # internally, so Lanczos quality is wasted and several times slower
+    return image.resize((new_width, new_height), Image.Resampling.BILINEAR)
+
+# Worker function for parallel rasterization
+def render_pages(pdf_bytes: bytes, page_indices: list, max_size: int, dpi: int = 150) -> list:
+    """
+    Render and downscale a set of pages from an in-memory PDF.
+    
+    MuPDF is not thread-safe, so pages are rendered in worker processes, each
+    opening its own copy of the document. This function lives outside app.py
+    so worker processes can import it without re-running the Streamlit script.
+    Pages are downscaled before being returned, so only one full-resolution
+    page per worker is alive at a time and only small images are sent back.
+    
+    Args:
+        pdf_bytes: Raw PDF file contents
+        page_indices: Zero-based indices of the pages to render
+        max_size: Maximum dimension (width or height) of the returned images
+        dpi: Rendering resolution in dots per inch
+    
+    Returns:
+        List of downscaled RGB PIL Images, in the same order as page_indices
+    """
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return [resize_image(render_page(doc, page_index, dpi), max_size) for page_index in page_indices]
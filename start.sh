@@ -34,18 +34,10 @@ source .venv/bin/activate
 # Check if dependencies are installed
 if ! python -c "import streamlit" 2>/dev/null; then
     echo -e "${YELLOW}Dependencies not found. Installing...${NC}"
-    uv pip install streamlit pdf2image mlx-vlm pillow ipykernel matplotlib torch torchvision
+    uv pip install streamlit pymupdf diskcache mlx-vlm pillow ipykernel matplotlib torch torchvision
     echo -e "${GREEN}✓ Dependencies installed${NC}"
 fi
 
-# Check for poppler (required by pdf2image)
-if ! command -v pdftoppm &> /dev/null; then
-    echo -e "${YELLOW}Warning: poppler-utils not found${NC}"
-    echo -e "${YELLOW}PDF conversion requires poppler. Install with:${NC}"
-    echo -e "${YELLOW}  brew install poppler${NC}"
-    echo ""
-fi
-
 echo -e "${GREEN}✓ Environment ready${NC}"
 echo ""
 echo -e "${BLUE}Starting Streamlit app...${NC}"